@@ -1,14 +1,17 @@
 import streamlit as st
 import os
+import io
 import json
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
-from concurrent.futures import ThreadPoolExecutor
-from backend.gemini_processor import GeminiProcessor
+import xxhash
+from dataclasses import asdict
+from backend.gemini_processor import GeminiProcessor, topic_columns
+from backend.gemini_client import run_coroutine
 
 # Configure logging
 logging.basicConfig(
@@ -27,6 +30,7 @@ if 'results' not in st.session_state:
         'results': None,
         'timestamp': None,
         'toc_text': None,
+        'results_json': None,
         'export_success': False,
         'current_file': None,
         'processing_stage': None,
@@ -74,6 +78,45 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Extraction helpers - cached per upload so reruns skip re-parsing.
+# The cache key is an xxh3 digest computed by the caller; the bytes themselves are passed as
+# _data, which Streamlit leaves out of the key, so the upload is never run through its own hasher.
+@st.cache_data(show_spinner=False)
+def _extract_txt(digest: str, _data: bytes) -> str:
+    """Decode a plain-text transcript, replacing any invalid UTF-8 bytes"""
+    return _data.decode("utf-8", "replace")
+
+@st.cache_data(show_spinner=False)
+def _extract_pdf(digest: str, _data: bytes, max_chars: int = 200_000) -> str:
+    """Stream PDF pages into a single buffer, stopping once max_chars is reached"""
+    import fitz  # PyMuPDF
+    buf = io.StringIO()
+    with fitz.open(stream=_data, filetype="pdf") as doc:
+        for page in doc:
+            buf.write(page.get_text("text"))
+            buf.write("\n")
+            if buf.tell() >= max_chars:
+                break
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False)
+def _extract_docx(digest: str, _data: bytes) -> str:
+    """Extract paragraph text from a Word transcript"""
+    from docx import Document
+    doc = Document(io.BytesIO(_data))
+    return "\n".join(p.text for p in doc.paragraphs)
+
+EXTRACTORS = {
+    "txt": _extract_txt,
+    "pdf": _extract_pdf,
+    "docx": _extract_docx,
+}
+
+@st.cache_resource
+def get_processor(api_key: Optional[str]) -> GeminiProcessor:
+    """Share one Gemini processor (and its model handle) across reruns and sessions"""
+    return GeminiProcessor(api_key=api_key)
+
 # App Header
 st.title("DepoIndex")
 st.markdown("### AI-Powered Deposition Transcript Analysis")
@@ -97,20 +140,13 @@ if upload_method == "File Upload":
     )
     
     if uploaded_file:
-        file_ext = uploaded_file.name.split(".")[-1].lower()
+        file_ext = uploaded_file.name.rsplit(".", 1)[-1].lower()
         try:
-            if file_ext == "txt":
-                input_text = uploaded_file.read().decode("utf-8")
-                current_file = uploaded_file.name
-            elif file_ext == "pdf":
-                from PyPDF2 import PdfReader
-                reader = PdfReader(uploaded_file)
-                input_text = "\n".join(page.extract_text() or "" for page in reader.pages)
-                current_file = uploaded_file.name
-            elif file_ext == "docx":
-                from docx import Document
-                doc = Document(uploaded_file)
-                input_text = "\n".join(p.text for p in doc.paragraphs)
+            extractor = EXTRACTORS.get(file_ext)
+            if extractor:
+                # getvalue() returns the buffered upload without re-reading the stream
+                data = uploaded_file.getvalue()
+                input_text = extractor(xxhash.xxh3_128_hexdigest(data), data)
                 current_file = uploaded_file.name
         except Exception as e:
             st.error(f"Error processing file: {str(e)}")
@@ -143,6 +179,14 @@ if input_text:
     
     if word_count < 100:
         st.warning("Transcript seems very short. Minimum 100 words recommended.")
+    
+    # Gemini only sees a bounded prefix - slice it once here rather than per request
+    gemini_input = input_text[:GeminiProcessor.MAX_TRANSCRIPT_CHARS]
+    if len(gemini_input) < len(input_text):
+        st.info(
+            f"Only the first {GeminiProcessor.MAX_TRANSCRIPT_CHARS:,} characters "
+            f"of the transcript are sent for AI analysis."
+        )
 
 # Processing functions
 def _convert_results(results) -> Dict[str, Any]:
@@ -175,6 +219,16 @@ def _convert_results(results) -> Dict[str, Any]:
             }
         }
 
+def _results_json(results: Dict[str, Any]) -> bytes:
+    """Serialize results for download; called once per analysis run and kept in session state"""
+    # Convert TopicModel objects to dicts for JSON serialization
+    downloadable_results = {
+        "metadata": results.get("metadata", {}),
+        "topics": [asdict(t) for t in results.get("topics") or []],
+        "summary": results.get("summary", "")
+    }
+    return json.dumps(downloadable_results, indent=2).encode("utf-8")
+
 def update_progress(stage: str, progress: int):
     """Update processing progress"""
     st.session_state.processing_stage = stage
@@ -185,49 +239,34 @@ def analyze_transcript(transcript_text: str, use_ai: bool, num_topics: int = 5)
     """Main analysis pipeline"""
     try:
         update_progress("Initializing", 10)
-        processor = GeminiProcessor(api_key=GEMINI_API_KEY if use_ai else None)
+        processor = get_processor(GEMINI_API_KEY if use_ai else None)
         
         # Check if processor initialized properly
         if use_ai and not processor.model:
+            get_processor.clear()  # Don't keep a failed init cached
             raise RuntimeError("Failed to initialize Gemini processor")
         
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # Generate topics
-            future_topics = executor.submit(
-                processor.analyze_transcript,
-                transcript_text,
-                num_topics
-            )
-            update_progress("Extracting topics", 30)
-            
-            # Get results
-            topics = future_topics.result()
-            
-            # Handle empty results
-            if not topics:
-                raise RuntimeError("No topics could be generated")
-                
-            results = _convert_results(topics)
-            update_progress("Processing results", 60)
-            
-            # Generate TOC if available
-            toc_text = ""
-            if use_ai and topics:
-                future_toc = executor.submit(
-                    processor.generate_enhanced_toc,
-                    [t.__dict__ for t in topics] if hasattr(topics[0], '__dict__') else topics
-                )
-                update_progress("Generating TOC", 80)
-                toc_text = future_toc.result() or ""
-            
-            update_progress("Finalizing", 95)
-            
-            return {
-                "results": results,
-                "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
-                "toc_text": toc_text,
-                "export_success": bool(topics)
-            }
+        update_progress("Extracting topics and TOC", 30)
+        # One request returns both topics and TOC, saving a rate-limit window and a round trip.
+        # It runs on the shared Gemini loop: the cached processor's async client outlives any one asyncio.run
+        topics, toc_text = run_coroutine(
+            processor.agenerate_topics_and_toc(transcript_text, num_topics)
+        )
+
+        # Handle empty results
+        if not topics:
+            raise RuntimeError("No topics could be generated")
+
+        results = _convert_results(topics)
+        update_progress("Finalizing", 95)
+
+        return {
+            "results": results,
+            "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "toc_text": toc_text if use_ai else "",
+            "results_json": _results_json(results),
+            "export_success": bool(topics)
+        }
             
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}")
@@ -240,6 +279,7 @@ if input_text and st.button("🚀 Start Analysis", type="primary"):
         'results': None,
         'timestamp': None,
         'toc_text': None,
+        'results_json': None,
         'export_success': False,
         'current_file': current_file,
         'processing_stage': "Starting",
@@ -253,7 +293,7 @@ if input_text and st.button("🚀 Start Analysis", type="primary"):
     try:
         # Run analysis
         analysis_result = analyze_transcript(
-            input_text, 
+            gemini_input, 
             use_gemini, 
             num_topics
         )
@@ -278,24 +318,21 @@ if st.session_state.results:
     
     st.header("📊 Analysis Results")
     
+    topics = results.get("topics") or []
+    
     # Summary metrics
     col1, col2 = st.columns(2)
     with col1:
-        topics_count = len(results.get("topics", []))
-        st.metric("Total Topics", topics_count)
+        st.metric("Total Topics", len(topics))
     with col2:
-        # Fixed: Use attribute access instead of .get()
-        key_issues = sum(1 for t in results.get("topics", []) if t.is_key_issue)
+        key_issues = sum(1 for t in topics if t.is_key_issue)
         st.metric("Key Issues", key_issues)
     
-    # Topic list - convert to dicts for dataframe
+    # Topic list - columnar data for the dataframe
     st.subheader("Topic List")
-    if results.get("topics"):
-        # Convert TopicModel objects to dictionaries
-        topics_data = [t.__dict__ for t in results["topics"]]
-        
+    if topics:
         st.dataframe(
-            topics_data,
+            topic_columns(topics),
             column_config={
                 "title": "Topic",
                 "page": "Page",
@@ -316,7 +353,7 @@ if st.session_state.results:
         
         # Add expandable details for each topic
         with st.expander("View Topic Details"):
-            for topic in results["topics"]:
+            for topic in topics:
                 st.markdown(f"### {topic.title}")
                 cols = st.columns(3)
                 with cols[0]:
@@ -351,20 +388,12 @@ if st.session_state.results:
     st.header("📥 Download Results")
     
     # JSON download
-    if st.session_state.results:
-        # Convert TopicModel objects to dicts for JSON serialization
-        downloadable_results = {
-            "metadata": results.get("metadata", {}),
-            "topics": [t.__dict__ for t in results.get("topics", [])],
-            "summary": results.get("summary", "")
-        }
-        
-        st.download_button(
-            "Download Analysis (JSON)",
-            json.dumps(downloadable_results, indent=2),
-            f"deposition_analysis_{st.session_state.timestamp}.json",
-            help="Complete analysis results in JSON format"
-        )
+    st.download_button(
+        "Download Analysis (JSON)",
+        st.session_state.results_json,
+        f"deposition_analysis_{st.session_state.timestamp}.json",
+        help="Complete analysis results in JSON format"
+    )
 
 # Footer
 st.markdown("---")
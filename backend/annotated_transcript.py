@@ -1,12 +1,18 @@
 # backend/annotated_transcript.py
 
-import json
+from operator import itemgetter
 from docx import Document
 
+from backend.utils import json_loads
+
 def export_annotated_transcript(topics_path, out_md, out_docx):
-    with open(topics_path, "r", encoding="utf-8") as f:
-        topics = json.load(f)
+    with open(topics_path, "rb") as f:
+        topics = json_loads(f.read())
+
+    export_annotated_topics(topics, out_md, out_docx)
 
+def export_annotated_topics(topics, out_md, out_docx):
+    """Export already-loaded topics, skipping the JSON write/read round trip."""
     valid_topics = []
     for i, topic in enumerate(topics):
         if not isinstance(topic, dict):
@@ -18,21 +24,20 @@ def export_annotated_transcript(topics_path, out_md, out_docx):
         valid_topics.append(topic)
 
     try:
-        valid_topics.sort(key=lambda x: (x['page'], x['line']))
+        valid_topics.sort(key=itemgetter('page', 'line'))
     except Exception as e:
         print(f"❌ Error sorting transcript entries: {e}")
         return
 
     # --- MARKDOWN EXPORT ---
-    md_lines = ["# 📝 Annotated Full Transcript\n"]
-    for i, topic in enumerate(valid_topics, 1):
-        md_lines.append(f"## {i}. {topic['topic']}")
-        md_lines.append(f"*(Page {topic['page']} · Line {topic['line']})*\n")
-        md_lines.append(topic['text'].strip())
-        md_lines.append("")  # Blank line for spacing
-
     with open(out_md, "w", encoding="utf-8") as f:
-        f.write("\n".join(md_lines))
+        f.write("# 📝 Annotated Full Transcript\n\n")
+        f.writelines(
+            f"## {i}. {topic['topic']}\n"
+            f"*(Page {topic['page']} · Line {topic['line']})*\n\n"
+            f"{topic['text'].strip()}\n\n"
+            for i, topic in enumerate(valid_topics, 1)
+        )
 
     # --- DOCX EXPORT ---
     doc = Document()
@@ -1,11 +1,34 @@
 # backend/export_transcript.py
 
 from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
 import os
-from typing import List, Dict, Optional
+import re
+from itertools import islice
+from typing import Iterable, List, Dict, Optional
 
 from backend.gemini_processor import GeminiProcessor
 
+_TOC_LINE_RE = re.compile(
+    r'^(?P<heading>#+)\s*(?P<heading_text>.*)'
+    r'|^[-*•]\s+(?P<bullet>.*)'
+    r'|^(?P<numbered>\d.*)'
+)
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+# Every separator str.splitlines() breaks on - form feeds etc. must not reach <w:t>, which rejects them
+_LINE_BREAK_RE = re.compile(r'\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+
+
+def _iter_lines(text: str) -> Iterable[str]:
+    """Lazy equivalent of text.splitlines(), so callers can stop early without splitting everything."""
+    start = 0
+    for m in _LINE_BREAK_RE.finditer(text):
+        yield text[start:m.start()]
+        start = m.end()
+    if start < len(text):
+        yield text[start:]
+
 
 def export_full_transcript(
     transcript_text: str,
@@ -15,8 +38,8 @@ def export_full_transcript(
     max_lines: int = 5000
 ) -> bool:
     """Enhanced export with Gemini-powered TOC."""
-    lines = transcript_text.splitlines()[:max_lines]
-    processed_text = "\n".join(lines)
+    # Stop reading after max_lines instead of splitting the whole transcript
+    lines = list(islice(_iter_lines(transcript_text), max_lines))
 
     doc = Document()
     processor = GeminiProcessor(gemini_api_key) if gemini_api_key else None
@@ -43,9 +66,7 @@ def export_full_transcript(
     # Add Transcript
     doc.add_page_break()
     doc.add_heading("FULL TRANSCRIPT", level=1)
-    for line in lines:
-        if line.strip():
-            doc.add_paragraph(line)
+    _append_plain_paragraphs(doc, filter(str.strip, lines))
 
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -56,6 +77,24 @@ def export_full_transcript(
         return False
 
 
+def _append_plain_paragraphs(doc: Document, lines: Iterable[str]) -> None:
+    """Bulk-append unstyled paragraphs as raw <w:p> elements, skipping python-docx's per-call overhead."""
+    body = doc.element.body
+    sect_pr = body.find(qn('w:sectPr'))  # Section properties must stay the last body child
+    for line in lines:
+        t = OxmlElement('w:t')
+        t.text = line
+        t.set(qn('xml:space'), 'preserve')
+        r = OxmlElement('w:r')
+        r.append(t)
+        p = OxmlElement('w:p')
+        p.append(r)
+        if sect_pr is not None:
+            sect_pr.addprevious(p)
+        else:
+            body.append(p)
+
+
 def _add_gemini_toc(doc: Document, toc_content: str) -> None:
     """Add formatted Gemini-generated TOC."""
     for line in toc_content.split('\n'):
@@ -63,23 +102,30 @@ def _add_gemini_toc(doc: Document, toc_content: str) -> None:
         if not line:
             continue
 
-        if line.startswith('#'):
-            level = min(line.count('#'), 3)
-            doc.add_heading(line.replace('#', '').strip(), level=level)
+        match = _TOC_LINE_RE.match(line)
+        kind = match.lastgroup if match else None
+
+        if kind == 'heading_text':
+            level = min(len(match.group('heading')), 3)
+            doc.add_heading(match.group('heading_text').strip(), level=level)
+            continue
+
+        if kind == 'bullet':
+            p = doc.add_paragraph(style='ListBullet')
+            text = match.group('bullet')
+        elif kind == 'numbered':
+            p = doc.add_paragraph(style='ListNumber')
+            text = line
         else:
-            if line.startswith(('- ', '* ', '• ')):
-                p = doc.add_paragraph(line[2:], style='ListBullet')
-            elif line[0].isdigit():
-                p = doc.add_paragraph(line, style='ListNumber')
-            else:
-                p = doc.add_paragraph(line)
-
-            # Bold legal terms wrapped in **
-            if '**' in line:
-                for run in p.runs:
-                    if '**' in run.text:
-                        run.text = run.text.replace('**', '')
-                        run.bold = True
+            p = doc.add_paragraph()
+            text = line
+
+        # Bold legal terms wrapped in ** - odd split positions are the bold spans
+        for i, part in enumerate(_BOLD_RE.split(text)):
+            if part:
+                run = p.add_run(part)
+                if i % 2:
+                    run.bold = True
 
 
 def _add_basic_toc(doc: Document, topics: List[Dict]) -> None:
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+import logging
+from typing import Awaitable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The Gemini SDK's async client is bound to the event loop that first used it, so every
+# coroutine touching a model goes through this one long-lived loop instead of asyncio.run
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Start the shared event loop on a daemon thread the first time it is needed"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="gemini-event-loop", daemon=True).start()
+            logger.debug("Started shared Gemini event loop")
+    return _loop
+
+def run_coroutine(coro: Awaitable[T]) -> T:
+    """Run coro on the shared event loop and block until it finishes (not callable from that loop)"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+class RateLimiter:
+    """Spaces API calls at least interval_ns apart by handing each caller its own call slot"""
+
+    def __init__(self, interval_ns: int):
+        self.interval_ns = interval_ns
+        self._next_call_ns = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Claim the next free call slot and return the seconds to wait for it"""
+        with self._lock:
+            now = time.monotonic_ns()
+            slot = max(now, self._next_call_ns)
+            self._next_call_ns = slot + self.interval_ns
+        return (slot - now) / 1e9
+
+    def wait(self) -> None:
+        """Block the calling thread until its slot comes up"""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def await_slot(self) -> None:
+        """Yield to the event loop until the slot comes up"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
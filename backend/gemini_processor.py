@@ -1,10 +1,13 @@
 import google.generativeai as genai
-from typing import List, Dict, Optional
-from dataclasses import dataclass
-import json
-import time
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass, fields, asdict
+from diskcache import Cache
+import xxhash
 import logging
 
+from backend.utils import json_loads, json_dumps
+from backend.gemini_client import RateLimiter
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -12,7 +15,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Fixed instructions shared by every request - sent once as the system instruction
+GEMINI_SYSTEM_PROMPT = """You are a legal AI assistant analyzing deposition transcripts.
+
+When asked for topics, give each topic:
+- A concise 3-5 word title
+- Page and line references
+- Whether it contains key legal issues
+- Confidence score (0-1)
+- Related legal concepts
+
+and return them in this JSON format:
+{
+    "topics": [
+        {
+            "title": "string",
+            "page": int,
+            "line": int,
+            "context": "string",
+            "is_key_issue": bool,
+            "confidence": float,
+            "related_topics": ["string"]
+        }
+    ]
+}"""
+
+@dataclass(slots=True)
 class TopicModel:
     title: str
     page: int
@@ -23,10 +51,20 @@ class TopicModel:
     related_topics: List[str] = None
     legal_significance: str = None
 
+def topic_columns(topics: List[TopicModel]) -> Dict[str, list]:
+    """Column-oriented view of topics (one list per field) for tabular display"""
+    return {f.name: [getattr(t, f.name) for t in topics] for f in fields(TopicModel)}
+
 class GeminiProcessor:
-    def __init__(self, api_key: Optional[str] = None):
+    MODEL_NAME = 'gemini-1.5-flash'
+    RATE_LIMIT_DELAY_NS = 1_500_000_000  # 1.5 seconds between calls
+    MAX_TRANSCRIPT_CHARS = 10_000  # Transcript prefix sent to Gemini per request
+
+    def __init__(self, api_key: Optional[str] = None, cache_dir: Optional[str] = ".depoindex_cache"):
         self.model = self._init_gemini(api_key) if api_key else None
-        self.rate_limit_last_call = 0
+        self._rate_limiter = RateLimiter(self.RATE_LIMIT_DELAY_NS)
+        # Persistent response cache - Gemini output for the same prompt is stable enough to reuse
+        self.cache = Cache(cache_dir) if self.model and cache_dir else None
 
     def _init_gemini(self, api_key: str) -> Optional[genai.GenerativeModel]:
         """Initialize Gemini with proper safety settings"""
@@ -41,7 +79,8 @@ class GeminiProcessor:
             }
             
             return genai.GenerativeModel(
-                'gemini-1.5-flash',
+                self.MODEL_NAME,
+                system_instruction=GEMINI_SYSTEM_PROMPT,
                 generation_config={
                     "temperature": 0.3,
                     "top_p": 0.95,
@@ -53,74 +92,159 @@ class GeminiProcessor:
             logger.error(f"Gemini initialization failed: {str(e)}")
             return None
 
-    def analyze_transcript(self, text: str, num_topics: int = 5) -> List[TopicModel]:
-        """Public method to analyze transcript and generate topics"""
-        return self.generate_topics(text, num_topics)
-
     def generate_topics(self, text: str, num_topics: int = 5) -> List[TopicModel]:
         """Generate topics from transcript text"""
         if not self.model:
             return []
-            
-        prompt = f"""
-        Analyze this legal deposition transcript and identify {num_topics} key topics.
-        For each topic provide:
-        - A concise 3-5 word title
-        - Page and line references
-        - Whether it contains key legal issues
-        - Confidence score (0-1)
-        - Related legal concepts
-        
-        Return in this JSON format:
-        {{
-            "topics": [
-                {{
-                    "title": "string",
-                    "page": int,
-                    "line": int,
-                    "context": "string",
-                    "is_key_issue": bool,
-                    "confidence": float,
-                    "related_topics": ["string"]
-                }}
-            ]
-        }}
-        
-        Transcript:
-        {text[:10000]}  # First 10k chars for demo
-        """
+
+        key = self._cache_key("topics", text[:self.MAX_TRANSCRIPT_CHARS], num_topics)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return [TopicModel(**t) for t in cached]
         
         try:
-            self._enforce_rate_limit()
-            response = self.model.generate_content(prompt)
-            
-            if response.candidates and response.candidates[0].content.parts:
-                result = json.loads(response.text)
-                return [
-                    TopicModel(
-                        title=topic.get("title", "Unspecified Topic"),
-                        page=topic.get("page", 1),
-                        line=topic.get("line", 1),
-                        context=topic.get("context", ""),
-                        is_key_issue=topic.get("is_key_issue", False),
-                        confidence=topic.get("confidence", 0.7),
-                        related_topics=topic.get("related_topics", [])
-                    )
-                    for topic in result.get("topics", [])
-                ]
+            self._rate_limiter.wait()
+            response = self.model.generate_content(self._topics_prompt(text, num_topics))
+            return self._store_topics(key, self._parse_topics(response))
         except Exception as e:
             logger.error(f"Topic generation failed: {e}")
         
         return []
 
+    async def agenerate_topics(self, text: str, num_topics: int = 5) -> List[TopicModel]:
+        """Async variant of generate_topics that doesn't block a thread on the API call"""
+        if not self.model:
+            return []
+
+        key = self._cache_key("topics", text[:self.MAX_TRANSCRIPT_CHARS], num_topics)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return [TopicModel(**t) for t in cached]
+
+        try:
+            await self._rate_limiter.await_slot()
+            response = await self.model.generate_content_async(self._topics_prompt(text, num_topics))
+            return self._store_topics(key, self._parse_topics(response))
+        except Exception as e:
+            logger.error(f"Topic generation failed: {e}")
+
+        return []
+
+    def _topics_prompt(self, text: str, num_topics: int, extra: str = "") -> str:
+        """Build the topic extraction prompt; the transcript goes last so requests share a prefix"""
+        return f"""
+        Analyze this legal deposition transcript and identify {num_topics} key topics.
+        {extra}
+        Transcript:
+        {text[:self.MAX_TRANSCRIPT_CHARS]}
+        """
+
+    def _parse_topics(self, response) -> List[TopicModel]:
+        """Convert a Gemini topics response into TopicModel objects"""
+        return self._build_topics(self._response_json(response))
+
+    def _response_json(self, response) -> Dict:
+        """Decode the JSON body of a Gemini response"""
+        if not (response.candidates and response.candidates[0].content.parts):
+            return {}
+        return json_loads(response.text)
+
+    def _build_topics(self, result: Dict) -> List[TopicModel]:
+        """Build TopicModel objects from a decoded topics payload"""
+        return [
+            TopicModel(
+                title=topic.get("title", "Unspecified Topic"),
+                page=topic.get("page", 1),
+                line=topic.get("line", 1),
+                context=topic.get("context", ""),
+                is_key_issue=topic.get("is_key_issue", False),
+                confidence=topic.get("confidence", 0.7),
+                related_topics=topic.get("related_topics", [])
+            )
+            for topic in result.get("topics", [])
+        ]
+
+    async def agenerate_topics_and_toc(self, text: str, num_topics: int = 5) -> Tuple[List[TopicModel], str]:
+        """Generate topics and a markdown TOC with a single Gemini call"""
+        if not self.model:
+            return [], ""
+
+        key = self._cache_key("analysis", text[:self.MAX_TRANSCRIPT_CHARS], num_topics)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return self._build_topics(cached), cached.get("toc_markdown") or ""
+
+        try:
+            await self._rate_limiter.await_slot()
+            response = await self.model.generate_content_async(self._topics_and_toc_prompt(text, num_topics))
+            return self._store_analysis(key, self._response_json(response))
+        except Exception as e:
+            logger.error(f"Combined topic/TOC generation failed: {e}")
+
+        return [], ""
+
+    def _topics_and_toc_prompt(self, text: str, num_topics: int) -> str:
+        """Extend the topics prompt to also request the TOC in the same response"""
+        return self._topics_prompt(text, num_topics, extra="""
+        Also produce a professional Markdown table of contents for these topics
+        (logical section grouping, page/line references, key issue markers,
+        hierarchical headings) under the top-level key "toc_markdown" as a string.
+        """)
+
+    def _store_analysis(self, key: str, result: Dict) -> Tuple[List[TopicModel], str]:
+        """Build the combined result and persist the raw payload when it produced topics"""
+        analysis = (self._build_topics(result), result.get("toc_markdown") or "")
+        if analysis[0]:
+            self._cache_set(key, result)
+        return analysis
+
+    def _store_topics(self, key: str, topics: List[TopicModel]) -> List[TopicModel]:
+        """Persist generated topics and hand them back"""
+        if topics:
+            self._cache_set(key, [asdict(t) for t in topics])
+        return topics
+
+    def _cache_key(self, kind: str, payload: str, *extra) -> str:
+        """Cache key from the request kind, a digest of its input, and any extra parameters"""
+        digest = xxhash.xxh3_128_hexdigest(payload.encode("utf-8"))
+        return ":".join([kind, digest, *map(str, extra)])
+
+    def _cache_get(self, key: str):
+        """Look up a cached response, or None when caching is off or the key is missing"""
+        if self.cache is None:
+            return None
+        return self.cache.get(key)
+
+    def _cache_set(self, key: str, value) -> None:
+        """Store a response when caching is on"""
+        if self.cache is not None:
+            self.cache.set(key, value)
+
     def generate_enhanced_toc(self, topics: List[Dict]) -> str:
         """Generate a table of contents from topics"""
         if not self.model or not topics:
             return ""
-            
-        prompt = f"""
+
+        key = self._cache_key("toc", json_dumps(topics))
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            self._rate_limiter.wait()
+            response = self.model.generate_content(self._toc_prompt(topics))
+            if response.text:
+                self._cache_set(key, response.text)
+            return response.text
+        except Exception as e:
+            logger.error(f"TOC generation failed: {e}")
+            return ""
+
+    def _toc_prompt(self, topics: List[Dict]) -> str:
+        """Build the table of contents prompt"""
+        return f"""
         Create a professional table of contents for a legal deposition using these topics:
-        {json.dumps(topics, indent=2)}
+        {json_dumps(topics, indent=True)}
         
         Include:
         - Logical section grouping
@@ -130,18 +254,3 @@ class GeminiProcessor:
         
         Return in Markdown format with headings.
         """
-        
-        try:
-            self._enforce_rate_limit()
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            logger.error(f"TOC generation failed: {e}")
-            return ""
-
-    def _enforce_rate_limit(self):
-        """Ensure we don't exceed API rate limits"""
-        elapsed = time.time() - self.rate_limit_last_call
-        if elapsed < 1.5:  # 1.5 seconds between calls
-            time.sleep(1.5 - elapsed)
-        self.rate_limit_last_call = time.time()
\ No newline at end of file
@@ -1,13 +1,18 @@
 import json
 import argparse
-from docx import Document
 import os
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
 from pathlib import Path
 from datetime import datetime
+from operator import itemgetter
 import logging
+from tenacity import Retrying, wait_random_exponential, stop_after_attempt, before_sleep_log
 
-from backend.gemini_processor import GeminiProcessor, configure_gemini, generate_enhanced_toc
+from backend.utils import json_loads, json_dumps
+
+# docx and the Gemini SDK are slow to import - load them only on the paths that use them
+if TYPE_CHECKING:
+    from docx.document import Document
 
 # Configure logging
 logging.basicConfig(
@@ -19,21 +24,38 @@ logging.basicConfig(
     ]
 )
 
+# Parsed topics keyed by (path, mtime_ns, size) - any change to the file misses the cache
+_TOPICS_CACHE: Dict[Tuple[str, int, int], Tuple[List[Dict], List[Dict]]] = {}
+
 class TocGenerator:
     """Enhanced TOC generator with improved formatting and error handling."""
+    ATOMIC_WRITE_MIN_CHARS = 64 * 1024
 
     def __init__(self, gemini_api_key: Optional[str] = None):
-        self.model = configure_gemini(gemini_api_key) if gemini_api_key else None
+        # GeminiProcessor keeps TOC responses in its disk cache, so reruns on the same topics are free
+        self.processor = None
+        if gemini_api_key:
+            from backend.gemini_processor import GeminiProcessor
+            self.processor = GeminiProcessor(gemini_api_key)
         self.logger = logging.getLogger(__name__)
+        self._created_dirs: set = set()
 
     def load_topics(self, json_path: str) -> Tuple[List[Dict], List[Dict]]:
         """Load, validate and categorize topics."""
-        if not Path(json_path).exists():
+        try:
+            st = os.stat(json_path)
+        except FileNotFoundError:
             raise FileNotFoundError(f"Topics file not found: {json_path}")
 
+        key = (json_path, st.st_mtime_ns, st.st_size)
+        cached = _TOPICS_CACHE.get(key)
+        if cached is not None:
+            self.logger.info(f"Reusing parsed topics for {json_path}")
+            return list(cached[0]), list(cached[1])
+
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(json_path, 'rb') as f:
+                data = json_loads(f.read())
                 topics = data.get('topics', [])
                 self.logger.info(f"Loaded {len(topics)} raw topics from {json_path}")
                 
@@ -41,7 +63,8 @@ class TocGenerator:
                 if invalid:
                     self.logger.warning(f"Filtered out {len(invalid)} invalid topics")
                 
-                return valid, invalid
+                _TOPICS_CACHE[key] = (valid, invalid)
+                return list(valid), list(invalid)
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON format in {json_path}: {str(e)}")
 
@@ -66,27 +89,29 @@ class TocGenerator:
             else:
                 valid.append(topic)
 
-        # Sort by page/line with high confidence first
-        valid.sort(key=lambda x: (x['page'], x['line'], -x['confidence']))
+        # Sort by page/line with high confidence first. Two stable passes with C-level
+        # itemgetter keys give the same order as a composite (page, line, -confidence) key.
+        valid.sort(key=itemgetter('confidence'), reverse=True)
+        valid.sort(key=itemgetter('page', 'line'))
         return valid, invalid
 
     def _generate_basic_toc(self, topics: List[Dict]) -> str:
         """Improved fallback TOC generator with sections."""
-        toc = "# Deposition Table of Contents\n\n"
+        parts = ["# Deposition Table of Contents\n\n"]
         current_page = None
         
         for topic in topics:
             if topic['page'] != current_page:
                 current_page = topic['page']
-                toc += f"\n## Page {current_page}\n"
+                parts.append(f"\n## Page {current_page}\n")
             
-            toc += (
+            parts.append(
                 f"- **{topic['title']}** "
                 f"(Line {topic['line']}, Confidence: {topic['confidence']:.0%})\n"
             )
         
-        toc += f"\n*Generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}*"
-        return toc
+        parts.append(f"\n*Generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}*")
+        return "".join(parts)
 
     def generate_toc(
         self,
@@ -97,41 +122,48 @@ class TocGenerator:
     ) -> bool:
         """Generate and save TOC with retry logic."""
         try:
-            toc_content = None
-            attempts = 0
-            
-            while attempts <= max_retries and not toc_content:
-                try:
-                    if self.model:
-                        toc_content = generate_enhanced_toc(self.model, topics)
-                    else:
-                        toc_content = self._generate_basic_toc(topics)
-                except Exception as e:
-                    self.logger.warning(f"Attempt {attempts + 1} failed: {str(e)}")
-                    attempts += 1
-                    if attempts > max_retries:
-                        raise
+            if self.processor and self.processor.model:
+                retrying = Retrying(
+                    wait=wait_random_exponential(multiplier=0.3, max=8),
+                    stop=stop_after_attempt(max_retries + 1),
+                    before_sleep=before_sleep_log(self.logger, logging.WARNING),
+                    reraise=True
+                )
+                toc_content = retrying(self._gemini_toc, topics)
+            else:
+                toc_content = self._generate_basic_toc(topics)
 
             self._save_outputs(toc_content, markdown_path, docx_path)
             return True
         except Exception as e:
-            self.logger.error(f"TOC generation failed after {attempts} attempts: {str(e)}")
+            self.logger.error(f"TOC generation failed: {str(e)}")
             return False
 
+    def _gemini_toc(self, topics: List[Dict]) -> str:
+        """Single Gemini TOC attempt; an empty result counts as a failure."""
+        toc_content = self.processor.generate_enhanced_toc(topics)
+        if not toc_content:
+            raise RuntimeError("Gemini returned an empty TOC")
+        return toc_content
+
     def _save_outputs(self, content: str, md_path: str, docx_path: str) -> None:
-        """Save both output formats with atomic writes."""
-        # Ensure output directories exist
-        Path(md_path).parent.mkdir(parents=True, exist_ok=True)
-        Path(docx_path).parent.mkdir(parents=True, exist_ok=True)
-
-        # Save markdown
-        temp_md = f"{md_path}.tmp"
-        with open(temp_md, 'w', encoding='utf-8') as f:
-            f.write(content)
-        os.replace(temp_md, md_path)
+        """Save both output formats, atomically where a torn write would matter."""
+        self._ensure_parent(md_path)
+        self._ensure_parent(docx_path)
+
+        # Save markdown - small files go straight to disk, large ones keep the temp file + rename
+        if len(content) < self.ATOMIC_WRITE_MIN_CHARS:
+            with open(md_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        else:
+            temp_md = f"{md_path}.tmp"
+            with open(temp_md, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_md, md_path)
         self.logger.info(f"Markdown TOC saved to {md_path}")
 
         # Save DOCX
+        from docx import Document
         doc = Document()
         self._add_docx_content(doc, content)
         
@@ -140,23 +172,34 @@ class TocGenerator:
         os.replace(temp_docx, docx_path)
         self.logger.info(f"DOCX TOC saved to {docx_path}")
 
-    def _add_docx_content(self, doc: Document, content: str) -> None:
+    def _ensure_parent(self, path: str) -> None:
+        """Create a file's parent directory once per generator."""
+        parent = os.path.dirname(path) or "."
+        if parent not in self._created_dirs:
+            Path(parent).mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(parent)
+
+    def _add_docx_content(self, doc: "Document", content: str) -> None:
         """Add formatted content to Word document."""
-        current_heading_level = 0
+        # Resolve styles once instead of looking them up by name for every paragraph
+        list_bullet_style = doc.styles['List Bullet']
+        body_style = doc.styles['Body Text']
+        in_section = False
         
-        for line in content.split('\n'):
+        for line in content.splitlines():
             line = line.strip()
             if not line:
                 continue
                 
             if line.startswith('#'):
-                level = line.count('#')
-                doc.add_heading(line.replace('#', '').strip(), level=min(level, 3))
-                current_heading_level = level
+                heading = line.lstrip('#')
+                level = len(line) - len(heading)
+                doc.add_heading(heading.strip(), level=min(level, 3))
+                in_section = True
+            elif in_section:
+                doc.add_paragraph(line, list_bullet_style if line.startswith('-') else body_style)
             else:
-                para = doc.add_paragraph(line)
-                if current_heading_level > 0:
-                    para.style = 'List Bullet' if line.startswith('-') else 'Body Text'
+                doc.add_paragraph(line)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -210,8 +253,9 @@ def main():
         )
 
         if invalid_topics:
-            with open('invalid_topics.json', 'w') as f:
-                json.dump(invalid_topics, f, indent=2)
+            # Diagnostic dump only - compact is fine
+            with open('invalid_topics.json', 'w', encoding='utf-8') as f:
+                f.write(json_dumps(invalid_topics))
             logging.warning(f"Saved {len(invalid_topics)} invalid topics to invalid_topics.json")
 
         if not success:
@@ -1,14 +1,28 @@
 import re
 import argparse
-import json
-import os
 import logging
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterable, Union, TYPE_CHECKING
 from dataclasses import dataclass, asdict
 from pathlib import Path
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import google.generativeai as genai
+import asyncio
+from itertools import islice, groupby
+import threading
+import xxhash
+import numpy as np
+from json import JSONDecodeError
+from cachetools import TTLCache
+from tenacity import (
+    retry, retry_if_exception, wait_random_exponential, stop_after_attempt, before_sleep_log
+)
+from diskcache import Cache
+
+from backend.utils import json_loads, json_dumps
+from backend.gemini_client import RateLimiter, run_coroutine
+
+# The Gemini SDK is slow to import - only load it once a key is supplied
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 # Configure logging
 logging.basicConfig(
@@ -21,6 +35,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Static rubric shared by every segment prompt - sent once as the system instruction
+LEGAL_ANALYST_SYSTEM_PROMPT = """You are a legal AI assistant analyzing deposition transcript segments.
+
+Focus on:
+- Substantive legal issues
+- Key testimony
+- Critical admissions
+- Relevant objections
+
+Always answer in the exact JSON format requested."""
+
 @dataclass
 class Topic:
     title: str
@@ -32,22 +57,108 @@ class Topic:
     related_topics: List[str] = None
     legal_significance: str = None
 
+def _is_retryable(e: BaseException) -> bool:
+    """Retry malformed JSON replies and quota errors"""
+    if isinstance(e, JSONDecodeError):
+        return True
+    # Imported here: api_core pulls in grpc, and by the time a request has failed the SDK is loaded anyway
+    from google.api_core.exceptions import ResourceExhausted
+    return isinstance(e, ResourceExhausted)
+
+class _SemanticCache:
+    """Near-duplicate lookup of segment responses by embedding cosine similarity"""
+    ENCODER_NAME = 'all-MiniLM-L6-v2'
+    TTL = 24 * 60 * 60  # seconds
+    _encoder = None
+    _encoder_lock = threading.Lock()
+
+    def __init__(self, store: Optional[Cache], namespace: str):
+        self._store = store
+        self._key = f"semantic:{namespace}"
+        self._lock = threading.Lock()
+        entries = store.get(self._key) if store is not None else None
+        # Rows past len(self._payloads) are spare capacity, so an insert doesn't copy the whole matrix
+        self._vectors, self._payloads = entries or (None, [])
+        self._dirty = False
+
+    @classmethod
+    def embed(cls, text: str) -> np.ndarray:
+        """Unit-length embedding, so a dot product is the cosine similarity"""
+        with cls._encoder_lock:
+            if cls._encoder is None:
+                from sentence_transformers import SentenceTransformer  # heavy, only load when enabled
+                cls._encoder = SentenceTransformer(cls.ENCODER_NAME)
+        return cls._encoder.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def query(self, vec: np.ndarray, threshold: float) -> Optional[Dict]:
+        """Return the payload of the most similar cached segment if it clears the threshold"""
+        with self._lock:
+            if not self._payloads:
+                return None
+            sims = self._vectors[:len(self._payloads)] @ vec
+            best = int(sims.argmax())
+            return self._payloads[best] if sims[best] >= threshold else None
+
+    def insert(self, vec: np.ndarray, payload: Dict) -> None:
+        """Add a segment response in memory; persist() writes the namespace out"""
+        with self._lock:
+            n = len(self._payloads)
+            if self._vectors is None or n == len(self._vectors):
+                # Double the capacity so appends are amortized O(1)
+                grown = np.empty((max(16, 2 * n), vec.shape[0]), dtype=np.float32)
+                if n:
+                    grown[:n] = self._vectors[:n]
+                self._vectors = grown
+            self._vectors[n] = vec
+            self._payloads.append(payload)
+            self._dirty = True
+
+    def persist(self) -> None:
+        """Write the namespace to the store once, if anything was added"""
+        with self._lock:
+            if self._store is not None and self._dirty:
+                n = len(self._payloads)
+                self._store.set(self._key, (self._vectors[:n].copy(), self._payloads), expire=self.TTL)
+                self._dirty = False
+
 class TopicGenerator:
-    SPEAKER_PREFIXES = r"^(MR|MS|MRS|THE WITNESS|THE COURT|BY MR|BY MS|Q|A|ATTORNEY|COUNSEL)[\.:]?\s"
+    _SPEAKER_PREFIX_RE = re.compile(
+        r"^(MR|MS|MRS|THE WITNESS|THE COURT|BY MR|BY MS|Q|A|ATTORNEY|COUNSEL)[\.:]?\s",
+        re.IGNORECASE
+    )
+    _ANNOTATION_RE = re.compile(r"\[.*?\]")
     MIN_CONTENT_LENGTH = 5
     MAX_RETRIES = 3
-    RATE_LIMIT_DELAY = 1.5  # seconds
+    RATE_LIMIT_DELAY_NS = 1_500_000_000  # 1.5s between Gemini calls
+    MODEL_NAME = 'gemini-1.5-flash'
+    SEMANTIC_THRESHOLD = 0.95
+    BATCH_SIZE = 8  # segments per Gemini request
 
-    def __init__(self, gemini_api_key: Optional[str] = None):
+    def __init__(
+        self,
+        gemini_api_key: Optional[str] = None,
+        cache_dir: Optional[str] = ".depoindex_cache",
+        semantic_cache: bool = False,
+        workers: int = 4
+    ):
+        self.workers = workers
         self.gemini_model = self._init_gemini(gemini_api_key) if gemini_api_key else None
-        self.rate_limit_last_call = 0
+        self._rate_limiter = RateLimiter(self.RATE_LIMIT_DELAY_NS)
+        # Two-tier response cache: a short-lived in-process layer in front of the shared disk cache
+        self._mem_cache = TTLCache(maxsize=1024, ttl=600)
+        self._disk_cache = Cache(cache_dir) if self.gemini_model and cache_dir else None
+        self.semantic_cache = semantic_cache and self.gemini_model is not None
+        self._semantic = None  # scoped to one transcript by detect_topics
+        self.last_line_count = 0  # non-blank lines seen by the latest detect_topics call
 
-    def _init_gemini(self, api_key: str) -> Optional[genai.GenerativeModel]:
+    def _init_gemini(self, api_key: str) -> Optional["genai.GenerativeModel"]:
         """Initialize Gemini with enhanced configuration"""
         try:
+            import google.generativeai as genai
             genai.configure(api_key=api_key)
             return genai.GenerativeModel(
-                'gemini-1.5-flash',
+                self.MODEL_NAME,
+                system_instruction=LEGAL_ANALYST_SYSTEM_PROMPT,
                 generation_config={
                     "temperature": 0.3,
                     "top_p": 0.95,
@@ -64,35 +175,46 @@ class TopicGenerator:
             logger.error(f"Gemini initialization failed: {e}")
             return None
 
-    def _enforce_rate_limit(self):
-        """Ensure we don't exceed API rate limits"""
-        elapsed = time.time() - self.rate_limit_last_call
-        if elapsed < self.RATE_LIMIT_DELAY:
-            time.sleep(self.RATE_LIMIT_DELAY - elapsed)
-        self.rate_limit_last_call = time.time()
+    def _cache_key(self, prompt: str) -> str:
+        """Key a Gemini response on the model name and the exact prompt"""
+        return "segment:" + xxhash.xxh3_128_hexdigest(f"{self.MODEL_NAME}\n{prompt}".encode("utf-8"))
+
+    def _cache_get(self, key: str) -> Optional[Dict]:
+        """Look up a parsed response in memory, then on disk"""
+        data = self._mem_cache.get(key)
+        if data is None and self._disk_cache is not None:
+            data = self._disk_cache.get(key)
+            if data is not None:
+                self._mem_cache[key] = data
+        logger.debug(f"Gemini cache {'hit' if data is not None else 'miss'}: {key}")
+        return data
+
+    def _cache_set(self, key: str, data: Dict) -> None:
+        """Store a parsed response in both cache tiers"""
+        self._mem_cache[key] = data
+        if self._disk_cache is not None:
+            self._disk_cache.set(key, data)
 
     def clean_text(self, text: str) -> str:
         """Enhanced text cleaning with legal-specific patterns"""
-        text = re.sub(self.SPEAKER_PREFIXES, "", text, flags=re.IGNORECASE)
-        text = re.sub(r"\[.*?\]", "", text)  # Remove annotations
+        text = self._SPEAKER_PREFIX_RE.sub("", text)
+        text = self._ANNOTATION_RE.sub("", text)  # Remove annotations
         return text.strip()
 
     def is_content_line(self, line: str) -> bool:
         """More sophisticated content detection"""
+        # Needing 4+ letters also rejects numeric-only lines ("12 · 3 — 4"), so no separate check.
+        # filter/islice run in C and stop at the 4th letter instead of scanning the whole line.
         return (
             len(line) >= self.MIN_CONTENT_LENGTH and
             not line.startswith(('Page', 'Exhibit')) and
-            not re.fullmatch(r"[0-9 ·\-—]+", line) and
-            sum(c.isalpha() for c in line) > 3
+            next(islice(filter(str.isalpha, line), 3, None), None) is not None
         )
 
-    def generate_gemini_topic(self, lines: List[str], page: int) -> Optional[Topic]:
-        """Generate topic with retry logic and better prompt engineering"""
-        if not self.gemini_model or len(lines) < 2:
-            return None
-
-        prompt = f"""
-        As a legal AI assistant, analyze this deposition segment (Page {page}):
+    def _segment_prompt(self, lines: List[str], page: int) -> str:
+        """Single-segment prompt; also keys the cached response for that segment"""
+        return f"""
+        Analyze this deposition segment (Page {page}):
 
         {chr(10).join(f"- {self.clean_text(line)}" for line in lines[:5])}
 
@@ -104,102 +226,251 @@ class TopicGenerator:
             "legal_significance": "brief analysis",
             "related_topics": ["list", "of", "related", "concepts"]
         }}
+        """
+
+    def _batch_prompt(self, segments: List[Tuple[List[str], int]]) -> str:
+        """One prompt covering several segments, answered as an indexed JSON array"""
+        blocks = "\n\n".join(
+            f"Segment {n} (Page {page}):\n" + "\n".join(f"- {self.clean_text(line)}" for line in lines[:5])
+            for n, (lines, page) in enumerate(segments)
+        )
+        return f"""
+        Analyze each of these deposition segments:
+
+        {blocks}
 
-        Focus on:
-        - Substantive legal issues
-        - Key testimony
-        - Critical admissions
-        - Relevant objections
+        Provide analysis as a JSON array with one object per segment, in this exact format:
+        [
+            {{
+                "index": segment number,
+                "title": "3-7 word professional title",
+                "is_key_issue": boolean,
+                "confidence": 0.0-1.0,
+                "legal_significance": "brief analysis",
+                "related_topics": ["list", "of", "related", "concepts"]
+            }}
+        ]
         """
-        
-        for attempt in range(self.MAX_RETRIES):
+
+    async def _lookup(self, prompt: str, lines: List[str], page: int) -> Tuple[str, Optional[Dict], Optional[np.ndarray]]:
+        """Check the exact cache, then the semantic cache, for a segment response"""
+        key = self._cache_key(prompt)
+        data = self._cache_get(key)
+        semantic = self._semantic
+        vec = None
+        if data is None and semantic is not None:
+            # Boilerplate exchanges rarely repeat byte-for-byte, so fall back to a near-duplicate match
+            # Encoding is CPU-bound, so keep it off the event loop
+            vec = await asyncio.to_thread(semantic.embed, "\n".join(lines[:5]))
+            data = semantic.query(vec, self.SEMANTIC_THRESHOLD)
+            logger.debug(f"Semantic cache {'hit' if data is not None else 'miss'} for page {page}")
+        return key, data, vec
+
+    def _remember(self, key: str, data: Dict, vec: Optional[np.ndarray]) -> None:
+        """Cache a fresh segment response in every enabled tier"""
+        self._cache_set(key, data)
+        if vec is not None and self._semantic is not None:
+            self._semantic.insert(vec, data)
+
+    def _make_topic(self, data: Dict, lines: List[str], page: int) -> Topic:
+        """Build a Topic from a parsed Gemini response"""
+        return Topic(
+            title=data.get("title", "Unspecified Topic"),
+            page=page,
+            line=0,
+            context="\n".join(lines[:3]),
+            is_key_issue=data.get("is_key_issue", False),
+            confidence=data.get("confidence", 0.5),
+            legal_significance=data.get("legal_significance"),
+            related_topics=data.get("related_topics", [])
+        )
+
+    async def generate_gemini_topic(self, lines: List[str], page: int) -> Optional[Topic]:
+        """Generate topic with retry logic and better prompt engineering"""
+        if not self.gemini_model or len(lines) < 2:
+            return None
+
+        prompt = self._segment_prompt(lines, page)
+        key, data, vec = await self._lookup(prompt, lines, page)
+        if data is None:
+            data = await self._request_topic(prompt)
+            if not isinstance(data, dict):
+                return None
+            self._remember(key, data, vec)
+
+        return self._make_topic(data, lines, page)
+
+    async def generate_gemini_topics_batch(self, segments: List[Tuple[List[str], int]]) -> List[Optional[Topic]]:
+        """Generate topics for several (lines, page) segments with a single Gemini request"""
+        results: List[Optional[Topic]] = [None] * len(segments)
+        if not self.gemini_model:
+            return results
+
+        pending = []
+        for i, (lines, page) in enumerate(segments):
+            if len(lines) < 2:
+                continue
+            key, data, vec = await self._lookup(self._segment_prompt(lines, page), lines, page)
+            if data is not None:
+                results[i] = self._make_topic(data, lines, page)
+            else:
+                pending.append((i, key, vec))
+
+        if not pending:
+            return results
+
+        reply = await self._request_topic(self._batch_prompt([segments[i] for i, _, _ in pending]))
+        by_index = self._index_batch_reply(reply, len(pending))
+
+        for n, (i, key, vec) in enumerate(pending):
+            lines, page = segments[i]
+            data = by_index.get(n)
+            if data is None:
+                # Unusable batch reply - ask for this segment on its own
+                results[i] = await self.generate_gemini_topic(lines, page)
+                continue
+            self._remember(key, data, vec)
+            results[i] = self._make_topic(data, lines, page)
+
+        return results
+
+    @staticmethod
+    def _index_batch_reply(reply, expected: int) -> Dict[int, Dict]:
+        """Map batch reply items to segment numbers, or {} unless they cover exactly 0..expected-1"""
+        if not isinstance(reply, list) or len(reply) != expected:
+            return {}
+        by_index = {}
+        for item in reply:
+            if not isinstance(item, dict):
+                return {}
             try:
-                self._enforce_rate_limit()
-                response = self.gemini_model.generate_content(prompt)
-                
-                # Handle different response formats
-                raw = response.text.strip()
-                if raw.startswith('```json'):
-                    raw = raw[7:-3].strip()  # Remove markdown code fences
-                
-                data = json.loads(raw)
-                return Topic(
-                    title=data.get("title", "Unspecified Topic"),
-                    page=page,
-                    line=0,
-                    context="\n".join(lines[:3]),
-                    is_key_issue=data.get("is_key_issue", False),
-                    confidence=data.get("confidence", 0.5),
-                    legal_significance=data.get("legal_significance"),
-                    related_topics=data.get("related_topics", [])
-                )
-            except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed: {e}")
-                if attempt == self.MAX_RETRIES - 1:
-                    logger.error("Max retries exceeded for segment")
-                    return None
-                time.sleep(2 ** attempt)  # Exponential backoff
-
-    def process_segment(self, lines: List[str], start_idx: int, lines_per_page: int) -> Tuple[List[Topic], int]:
+                by_index[int(item.pop("index"))] = item  # the model sometimes quotes the number
+            except (KeyError, TypeError, ValueError):
+                return {}
+        # Anything else (e.g. 1-based numbering) would attach topics to the wrong segments
+        return by_index if by_index.keys() == set(range(expected)) else {}
+
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        wait=wait_random_exponential(multiplier=0.3, max=8),
+        stop=stop_after_attempt(MAX_RETRIES),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True
+    )
+    async def _gemini_once(self, prompt: str):
+        """One Gemini round trip, parsed as JSON; malformed replies and quota errors are retried"""
+        response = await self.gemini_model.generate_content_async(prompt)
+
+        # Handle different response formats
+        raw = response.text.strip()
+        if raw.startswith('```json'):
+            raw = raw[7:-3].strip()  # Remove markdown code fences
+
+        return json_loads(raw)
+
+    async def _request_topic(self, prompt: str):
+        """Send a prompt to Gemini and parse its JSON reply, or None if it keeps failing"""
+        await self._rate_limiter.await_slot()
+        try:
+            return await self._gemini_once(prompt)
+        except Exception as e:
+            logger.error(f"Gemini request failed: {e}")
+            return None
+
+    def _basic_topic(self, lines: List[str], page: int, start_idx: int) -> Optional[Topic]:
+        """Fallback topic taken from the segment's first line"""
+        if not lines:
+            return None
+        title = self.clean_text(lines[0])[:50] or "Unspecified Topic"
+        return Topic(
+            title=title,
+            page=page,
+            line=start_idx + 1,
+            context=lines[0]
+        )
+
+    async def process_segment(self, lines: List[str], start_idx: int, lines_per_page: int) -> Tuple[List[Topic], int]:
         """Process text segment with parallel topic generation"""
         page = (start_idx // lines_per_page) + 1
-        topics = []
 
         # Try Gemini first if available
-        topic = self.generate_gemini_topic(lines, page)
+        topic = await self.generate_gemini_topic(lines, page)
         if topic:
             topic.line = start_idx + 1
-            topics.append(topic)
-            return topics, len(lines)
+            return [topic], len(lines)
 
         # Fallback to basic processing
-        if lines:
-            title = self.clean_text(lines[0])[:50] or "Unspecified Topic"
-            topics.append(Topic(
-                title=title,
-                page=page,
-                line=start_idx + 1,
-                context=lines[0]
-            ))
-
-        return topics, len(lines)
-
-    def detect_topics(self, transcript_text: str, lines_per_page: int = 30) -> List[Dict]:
-        """Main topic detection pipeline with parallel processing"""
-        lines = [line.strip() for line in transcript_text.splitlines() if line.strip()]
+        topic = self._basic_topic(lines, page, start_idx)
+        return ([topic] if topic else []), len(lines)
+
+    async def process_batch(self, batch: List[Tuple[List[str], int]], lines_per_page: int) -> List[Topic]:
+        """Process several (lines, start_idx) segments, sharing one Gemini request"""
+        pages = [(start_idx // lines_per_page) + 1 for _, start_idx in batch]
+        generated = await self.generate_gemini_topics_batch(
+            [(lines, page) for (lines, _), page in zip(batch, pages)]
+        )
+
+        topics = []
+        for (lines, start_idx), page, topic in zip(batch, pages, generated):
+            if topic:
+                topic.line = start_idx + 1
+            else:
+                topic = self._basic_topic(lines, page, start_idx)
+            if topic:
+                topics.append(topic)
+        return topics
+
+    async def _process_batches(self, batches: List[List[Tuple[List[str], int]]], lines_per_page: int) -> List[Topic]:
+        """Run batches concurrently on one event loop, at most `workers` in flight"""
+        sem = asyncio.Semaphore(self.workers)
+
+        async def run(batch):
+            async with sem:
+                return await self.process_batch(batch, lines_per_page)
+
         topics = []
+        for result in await asyncio.gather(*map(run, batches), return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Batch processing failed: {result}")
+            else:
+                topics.extend(result)
+        return topics
+
+    def detect_topics(self, transcript: Union[str, Iterable[str]], lines_per_page: int = 30) -> List[Dict]:
+        """Main topic detection pipeline with parallel processing"""
+        # Accept an open file or any line iterable so only the kept segments are held in memory
+        if isinstance(transcript, str):
+            transcript = transcript.splitlines()
+        lines = filter(None, map(str.strip, transcript))
         segments = []
-        current_segment = []
-
-        # First identify all content segments
-        for i, line in enumerate(lines):
-            if self.is_content_line(line):
-                current_segment.append(line)
-            elif current_segment:
-                segments.append((current_segment, i - len(current_segment)))
-                current_segment = []
-
-        if current_segment:
-            segments.append((current_segment, len(lines) - len(current_segment)))
-
-        # Process segments in parallel
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [
-                executor.submit(
-                    self.process_segment, 
-                    seg, 
-                    idx, 
-                    lines_per_page
-                ) 
-                for seg, idx in segments
-            ]
-            
-            for future in as_completed(futures):
-                try:
-                    new_topics, _ = future.result()
-                    topics.extend(new_topics)
-                except Exception as e:
-                    logger.error(f"Segment processing failed: {e}")
+
+        # First identify all content segments - groupby splits the lines into runs of
+        # content / non-content lines, keeping only the content runs as segments
+        pos = 0
+        for is_content, run in groupby(lines, key=self.is_content_line):
+            if is_content:
+                segment = list(run)
+                segments.append((segment, pos))
+                pos += len(segment)
+            else:
+                pos += sum(1 for _ in run)
+        self.last_line_count = pos
+
+        if self.semantic_cache:
+            # Namespace near-duplicate lookups to this transcript's content
+            digest = xxhash.xxh3_64()
+            for segment, _ in segments:
+                digest.update("\n".join(segment).encode("utf-8"))
+            self._semantic = _SemanticCache(self._disk_cache, digest.hexdigest())
+
+        # Batch segments so each Gemini request (and rate-limit wait) covers several of them
+        batches = [segments[i:i + self.BATCH_SIZE] for i in range(0, len(segments), self.BATCH_SIZE)]
+        # Shared loop rather than asyncio.run: the model's async client is bound to the first loop it used
+        try:
+            topics = run_coroutine(self._process_batches(batches, lines_per_page))
+        finally:
+            if self._semantic is not None:
+                self._semantic.persist()
 
         logger.info(f"Extracted {len(topics)} topics ({'with Gemini' if self.gemini_model else 'basic mode'})")
         return [asdict(t) for t in topics]
@@ -244,27 +515,35 @@ def main():
         default=4,
         help="Number of parallel workers"
     )
+    parser.add_argument(
+        '--semantic-cache',
+        action='store_true',
+        help="Reuse Gemini results for near-duplicate segments within a transcript"
+    )
 
     args = parser.parse_args()
     
     try:
         validate_args(args)
         start_time = time.time()
-        
-        with open(args.input_path, 'r', encoding='utf-8') as f:
-            transcript = f.read().strip()
 
-        if not transcript:
+        generator = TopicGenerator(
+            args.gemini_key,
+            semantic_cache=args.semantic_cache,
+            workers=args.workers
+        )
+        # Stream the file instead of reading it into one string and splitting it again
+        with open(args.input_path, 'r', encoding='utf-8') as f:
+            topics = generator.detect_topics(f, args.lines_per_page)
+        if not generator.last_line_count:
             raise ValueError("Empty transcript file")
 
-        generator = TopicGenerator(args.gemini_key)
-        topics = generator.detect_topics(transcript, args.lines_per_page)
-
         output_path = Path(args.output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
+        # Intermediate file read back by generate_toc, so skip pretty-printing
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump({
+            f.write(json_dumps({
                 "metadata": {
                     "source": args.input_path,
                     "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -272,7 +551,7 @@ def main():
                     "gemini_enabled": generator.gemini_model is not None
                 },
                 "topics": topics
-            }, f, indent=2)
+            }))
 
         logger.info(f"Results saved to {output_path}")
         if args.gemini_key and not generator.gemini_model:
@@ -1,14 +1,16 @@
 import argparse
-import json
+import asyncio
 import os
+import re
 import sys
 import time
 import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Union
 
 from backend.gemini_processor import GeminiProcessor, TopicModel
+from backend.utils import json_dumpb
+from backend.gemini_client import run_coroutine
 
 # Configure logging
 logging.basicConfig(
@@ -21,12 +23,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# All preprocess_transcript cleanup patterns fused so each line is scanned once
+_CLEAN_RE = re.compile(
+    r"(?:^(?:Q|A|MR|MS|MRS|THE WITNESS|EXAMINER)[\.:]?\s*)"  # Deponent/examiner markers
+    r"|(?:\[.*?\])"  # Annotations
+    r"|(?:Page \d+)"  # Page numbers
+    r"|(?:EXHIBIT\s+\d+)"  # Exhibit markers
+    r"|(?:\s{2,})",  # Extra whitespace
+    re.IGNORECASE
+)
+_QA_RE = re.compile(r"^(Q:|A:|Question|Answer)", re.IGNORECASE)
+
+def _clean_repl(match: re.Match) -> str:
+    """Collapse whitespace runs to one space and drop every other match"""
+    return " " if match.group(0).isspace() else ""
+
+_MARKER_INITIALS = frozenset("QAMTEqamte")
+
+def _may_need_cleaning(line: str) -> bool:
+    """Cheap conservative prefilter - False only when _CLEAN_RE cannot match the stripped line"""
+    # Every whitespace char except ' ' is non-printable, so this catches any 2+ whitespace run
+    if line[0] in _MARKER_INITIALS or "[" in line or "  " in line or not line.isprintable():
+        return True
+    lowered = line.lower()
+    return "page" in lowered or "exhibit" in lowered
+
 class TranscriptProcessor:
     """Enhanced transcript processing with better error handling and validation"""
     
     @staticmethod
-    def load_transcript(path: str) -> str:
-        """Load transcript file with comprehensive validation"""
+    def load_transcript(path: str) -> List[str]:
+        """Load transcript lines with comprehensive validation, streaming the file instead of reading one blob"""
         try:
             path_obj = Path(path)
             if not path_obj.exists():
@@ -35,10 +62,10 @@ class TranscriptProcessor:
                 raise ValueError("Transcript file is empty")
                 
             with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if not content.strip():
-                    raise ValueError("Transcript contains no readable content")
-                return content
+                lines = [line for line in map(str.strip, f) if line]
+            if not lines:
+                raise ValueError("Transcript contains no readable content")
+            return lines
                 
         except UnicodeDecodeError:
             logger.error("Transcript contains invalid UTF-8 characters")
@@ -48,26 +75,18 @@ class TranscriptProcessor:
             sys.exit(1)
 
     @staticmethod
-    def preprocess_transcript(text: str) -> str:
-        """Advanced cleaning with legal-specific patterns"""
+    def preprocess_transcript(text: Union[str, Iterable[str]]) -> str:
+        """Advanced cleaning with legal-specific patterns; accepts raw text or an iterable of lines"""
         # Remove deponent/examiner markers and exhibit references
-        patterns = [
-            r"^(Q|A|MR|MS|MRS|THE WITNESS|EXAMINER)[\.:]?\s*",
-            r"\[.*?\]",  # Remove annotations
-            r"Page \d+",  # Page numbers
-            r"EXHIBIT\s+\d+",  # Exhibit markers
-            r"\s{2,}",  # Extra whitespace
-        ]
-        
         cleaned_lines = []
-        for line in text.split('\n'):
+        for line in text.split('\n') if isinstance(text, str) else text:
             line = line.strip()
             if not line:
                 continue
                 
-            for pattern in patterns:
-                line = re.sub(pattern, "", line, flags=re.IGNORECASE)
-            line = line.strip()
+            # Most lines match none of the patterns - skip the regex engine for those
+            if _may_need_cleaning(line):
+                line = _CLEAN_RE.sub(_clean_repl, line).strip()
             
             if len(line) > 3 and any(c.isalpha() for c in line):  # Minimum viable content
                 cleaned_lines.append(line)
@@ -77,34 +96,24 @@ class TranscriptProcessor:
     @staticmethod
     def chunk_text(text: str, max_chars: int = 8000) -> List[str]:
         """Context-aware chunking that preserves legal discourse structure"""
-        paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-        chunks = []
-        current_chunk = []
+        paragraphs = [p for p in map(str.strip, text.split('\n')) if p]
+        if not paragraphs:
+            return []
+
+        # One pass collects the chunk start indices; chunks are then joined straight from slices
+        starts = [0]
         current_length = 0
-        
-        for para in paragraphs:
-            para_length = len(para)
-            
-            # Start new chunk if adding this paragraph would exceed limit
-            if current_length + para_length > max_chars and current_chunk:
-                chunks.append("\n".join(current_chunk))
-                current_chunk = []
+        qa_match = _QA_RE.match
+        for i, para in enumerate(paragraphs):
+            # Start new chunk if adding this paragraph would exceed limit,
+            # and keep each question/answer block at the head of its own chunk
+            if i > starts[-1] and (current_length + len(para) > max_chars or qa_match(para)):
+                starts.append(i)
                 current_length = 0
-                
-            # Special handling for question/answer blocks
-            if re.match(r"^(Q:|A:|Question|Answer)", para, re.IGNORECASE):
-                if current_chunk:
-                    chunks.append("\n".join(current_chunk))
-                    current_chunk = []
-                    current_length = 0
-                    
-            current_chunk.append(para)
-            current_length += para_length
-            
-        if current_chunk:
-            chunks.append("\n".join(current_chunk))
-            
-        return chunks
+            current_length += len(para)
+        starts.append(len(paragraphs))
+
+        return ["\n".join(paragraphs[a:b]) for a, b in zip(starts, starts[1:])]
 
     @staticmethod
     def save_results(results: Dict[str, Any], output_path: str) -> None:
@@ -115,11 +124,13 @@ class TranscriptProcessor:
             
             # Write to temp file first
             temp_path = output_path.with_suffix('.tmp')
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            with open(temp_path, 'wb') as f:
+                f.write(json_dumpb(results, indent=True))
+                f.flush()
+                os.fsync(f.fileno())
                 
             # Replace original file
-            temp_path.replace(output_path)
+            os.replace(temp_path, output_path)
             logger.info(f"Successfully saved results to {output_path}")
             
         except Exception as e:
@@ -131,10 +142,9 @@ class AnalysisPipeline:
     
     def __init__(self, processor: GeminiProcessor, max_workers: int = 4):
         self.processor = processor
-        self.max_workers = max_workers
-        self.rate_limit_delay = 1.5  # seconds between API calls
+        self.max_workers = max_workers  # concurrent Gemini requests; pacing is the processor's rate limiter
         
-    def process_transcript(self, text: str, num_topics: int = 5) -> Dict[str, Any]:
+    def process_transcript(self, text: Union[str, Iterable[str]], num_topics: int = 5) -> Dict[str, Any]:
         """Execute pipeline with progress monitoring"""
         logger.info("Starting transcript analysis pipeline")
         
@@ -149,7 +159,7 @@ class AnalysisPipeline:
             
         # Phase 2: Topic Generation (parallel)
         logger.info(f"Generating topics across {len(chunks)} chunks...")
-        topics = self._parallel_generate_topics(chunks, num_topics)
+        topics = run_coroutine(self._parallel_generate_topics(chunks, num_topics))
         
         if not topics:
             logger.error("No topics could be generated")
@@ -157,11 +167,22 @@ class AnalysisPipeline:
             
         # Phase 3: Topic Enhancement
         logger.info("Enhancing top topics...")
-        enhanced_topics = self._enhance_topics(topics)
+        enhanced_topics = run_coroutine(self._enhance_topics(topics))
         
         # Phase 4: Summary Generation
         logger.info("Generating final summary...")
         summary = self.processor.generate_deposition_summary(enhanced_topics)
+
+        # Confidence (key issues weighted 1.5x) and key-issue count in one pass
+        weighted = weights = 0.0
+        key_issues = 0
+        for t in enhanced_topics:
+            wt = 1.0
+            if t.is_key_issue:  # Gemini may send any truthy value, not just a bool
+                wt = 1.5
+                key_issues += 1
+            weighted += t.confidence * wt
+            weights += wt
         
         return {
             "metadata": {
@@ -170,51 +191,43 @@ class AnalysisPipeline:
                 "chunks_processed": len(chunks),
                 "gemini_version": "gemini-1.5-flash"
             },
-            "topics": [t.dict() for t in enhanced_topics],
+            "topics": enhanced_topics,  # dataclasses; orjson serializes them directly
             "summary": summary,
             "statistics": {
                 "total_topics": len(enhanced_topics),
-                "average_confidence": self._calculate_avg_confidence(enhanced_topics),
-                "key_issues": sum(1 for t in enhanced_topics if t.is_key_issue)
+                "average_confidence": weighted / weights if weights else 0.0,
+                "key_issues": key_issues
             }
         }
     
-    def _parallel_generate_topics(self, chunks: List[str], num_topics: int) -> List[TopicModel]:
-        """Process chunks in parallel with progress tracking"""
+    async def _parallel_generate_topics(self, chunks: List[str], num_topics: int) -> List[TopicModel]:
+        """Process chunks concurrently on one event loop, at most max_workers in flight"""
+        sem = asyncio.Semaphore(self.max_workers)
+
+        async def run(i: int, chunk: str) -> List[TopicModel]:
+            async with sem:
+                return await self._process_chunk(chunk, i, len(chunks), num_topics)
+
         topics = []
-        
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {
-                executor.submit(
-                    self._process_chunk,
-                    chunk,
-                    i,
-                    len(chunks),
-                    num_topics
-                ): i for i, chunk in enumerate(chunks)
-            }
-            
-            for future in as_completed(futures):
-                try:
-                    chunk_topics = future.result()
-                    topics.extend(chunk_topics)
-                except Exception as e:
-                    logger.warning(f"Chunk processing failed: {str(e)}")
+        results = await asyncio.gather(*(run(i, chunk) for i, chunk in enumerate(chunks)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Chunk processing failed: {str(result)}")
+            else:
+                topics.extend(result)
                     
         return topics
     
-    def _process_chunk(self, chunk: str, chunk_idx: int, total_chunks: int, num_topics: int) -> List[TopicModel]:
-        """Process individual chunk with rate limiting"""
+    async def _process_chunk(self, chunk: str, chunk_idx: int, total_chunks: int, num_topics: int) -> List[TopicModel]:
+        """Process individual chunk; the processor's async limiter spaces out the calls"""
         logger.info(f"Processing chunk {chunk_idx + 1}/{total_chunks}")
         try:
-            topics = self.processor.generate_topics(chunk, num_topics)
-            time.sleep(self.rate_limit_delay)
-            return topics
+            return await self.processor.agenerate_topics(chunk, num_topics)
         except Exception as e:
             logger.warning(f"Failed to process chunk {chunk_idx + 1}: {str(e)}")
             return []
     
-    def _enhance_topics(self, topics: List[TopicModel], max_to_enhance: int = 15) -> List[TopicModel]:
+    async def _enhance_topics(self, topics: List[TopicModel], max_to_enhance: int = 15) -> List[TopicModel]:
         """Enhanced topic processing with prioritization"""
         if not topics:
             return []
@@ -225,29 +238,22 @@ class AnalysisPipeline:
             key=lambda x: (x.is_key_issue, x.confidence),
             reverse=True
         )
-        
-        enhanced = []
-        for i, topic in enumerate(sorted_topics[:max_to_enhance], 1):
-            logger.info(f"Enhancing topic {i}/{min(len(topics), max_to_enhance)}: {topic.title[:50]}...")
-            try:
-                enhanced_topic = self.processor.enhance_topic(topic)
-                enhanced.append(enhanced_topic)
-                time.sleep(self.rate_limit_delay)
-            except Exception as e:
-                logger.warning(f"Topic enhancement failed: {str(e)}")
-                enhanced.append(topic)
-                
+        total = min(len(topics), max_to_enhance)
+        sem = asyncio.Semaphore(self.max_workers)
+
+        async def enhance(i: int, topic: TopicModel) -> TopicModel:
+            async with sem:
+                logger.info(f"Enhancing topic {i}/{total}: {topic.title[:50]}...")
+                try:
+                    return await asyncio.to_thread(self.processor.enhance_topic, topic)
+                except Exception as e:
+                    logger.warning(f"Topic enhancement failed: {str(e)}")
+                    return topic
+
+        enhanced = await asyncio.gather(
+            *(enhance(i, topic) for i, topic in enumerate(sorted_topics[:max_to_enhance], 1))
+        )
         return enhanced + sorted_topics[max_to_enhance:]
-    
-    def _calculate_avg_confidence(self, topics: List[TopicModel]) -> float:
-        """Weighted average calculation"""
-        if not topics:
-            return 0.0
-            
-        total = sum(t.confidence * (1.5 if t.is_key_issue else 1) for t in topics)
-        weights = sum(1.5 if t.is_key_issue else 1 for t in topics)
-        
-        return total / weights
 
 def validate_args(args: argparse.Namespace) -> None:
     """Comprehensive argument validation"""
@@ -311,10 +317,10 @@ def main():
         pipeline = AnalysisPipeline(processor, args.workers)
         
         logger.info(f"Loading transcript: {args.input_path}")
-        raw_text = TranscriptProcessor.load_transcript(args.input_path)
+        raw_lines = TranscriptProcessor.load_transcript(args.input_path)
         
         logger.info("Processing transcript...")
-        results = pipeline.process_transcript(raw_text, args.topics)
+        results = pipeline.process_transcript(raw_lines, args.topics)
         
         processing_time = time.time() - start_time
         results['statistics']['processing_time_seconds'] = round(processing_time, 2)
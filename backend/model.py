@@ -1,20 +1,71 @@
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from sentence_transformers import SentenceTransformer
 from sklearn.feature_extraction.text import TfidfVectorizer
 import numpy as np
+import xxhash
+from diskcache import Cache
+
+try:
+    import faiss  # Optional: sub-linear nearest-topic lookup for large caches
+except ImportError:
+    faiss = None
 
 # Load once globally
-model = SentenceTransformer('all-MiniLM-L6-v2')
-embedding_cache = []
+_ENCODER_NAME = 'all-MiniLM-L6-v2'
+model = SentenceTransformer(_ENCODER_NAME)
+# Unit-length float32 rows, one per cached chunk; empty until build_topic_clusters runs
+embedding_cache: np.ndarray = np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
 chunk_cache = []
-
-def build_topic_clusters(chunks, n_clusters=5):
+_faiss_index = None
+
+# Below FAISS_MIN_ROWS a plain matmul is as fast as an index; above HNSW_MIN_ROWS use approximate search
+FAISS_MIN_ROWS = 10_000
+HNSW_MIN_ROWS = 50_000
+
+# Embeddings persisted across runs, keyed by encoder + text hash; stored as float16 to halve disk use.
+# Stores are opened on first use, so importing this module touches no directories.
+EMBEDDING_CACHE_DIR = ".depoindex_embeddings"
+_embedding_stores = {}
+
+def _embedding_store(cache_dir):
+    """Open (once per path) the LRU disk cache holding embeddings"""
+    store = _embedding_stores.get(cache_dir)
+    if store is None:
+        store = _embedding_stores.setdefault(
+            cache_dir, Cache(cache_dir, eviction_policy="least-recently-used")
+        )
+    return store
+
+def encode_cached(texts, cache_dir=EMBEDDING_CACHE_DIR):
+    """Encode texts to unit-length float32 rows, running the model only on cache misses"""
+    store = _embedding_store(cache_dir)
+    keys = [f"{_ENCODER_NAME}:{xxhash.xxh3_128_hexdigest(t.encode('utf-8'))}" for t in texts]
+    rows = [store.get(k) for k in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+
+    if missing:
+        fresh = model.encode(
+            [texts[i] for i in missing],
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        with store.transact():
+            for i, vec in zip(missing, fresh):
+                rows[i] = vec.astype(np.float16)
+                store.set(keys[i], rows[i])
+
+    return np.vstack(rows).astype(np.float32)
+
+def build_topic_clusters(chunks, n_clusters=5, cache_dir=EMBEDDING_CACHE_DIR):
     texts = [chunk["text"] for chunk in chunks]
-    embeddings = model.encode(texts)
+    # Unit-length rows make k-means approximate cosine (spherical) clustering
+    embeddings = encode_cached(texts, cache_dir)
 
     # Reduce clusters if too few samples
     n_clusters = min(n_clusters, len(texts))
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1024, n_init=3, random_state=42)
     labels = kmeans.fit_predict(embeddings)
 
     for i, chunk in enumerate(chunks):
@@ -31,43 +82,83 @@ def build_topic_clusters(chunks, n_clusters=5):
     for chunk in chunks:
         chunk["topic_name"] = topic_keywords[chunk["cluster"]]
 
-    # Populate caches
-    global embedding_cache, chunk_cache
-    embedding_cache = model.encode([chunk["text"] for chunk in chunks])
+    # Populate caches - reuse the embeddings above; they are already unit length, so a lookup is one matrix-vector product
+    global embedding_cache, chunk_cache, _faiss_index
+    embedding_cache = np.ascontiguousarray(embeddings)
     chunk_cache = chunks
+    _faiss_index = _build_faiss_index(embedding_cache)
 
     return chunks
 
 
+def _build_faiss_index(embeddings):
+    """Inner-product index over the unit-length rows, or None when FAISS is missing or the cache is small"""
+    if faiss is None or embeddings.shape[0] < FAISS_MIN_ROWS:
+        return None
+
+    dim = embeddings.shape[1]
+    if embeddings.shape[0] >= HNSW_MIN_ROWS:
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+    else:
+        index = faiss.IndexFlatIP(dim)
+    index.add(embeddings)
+    return index
+
+
+def _best_matches(queries):
+    """Index of the most similar cached chunk for each unit-length query row"""
+    if _faiss_index is not None:
+        _, best = _faiss_index.search(np.ascontiguousarray(queries), 1)
+        return best[:, 0]
+    return (queries @ embedding_cache.T).argmax(axis=1)
+
+
 def extract_cluster_keywords(cluster_texts):
-    vectorizer = TfidfVectorizer(stop_words='english', max_features=50)
+    # Fit once across all clusters instead of re-tokenizing and rebuilding a vocabulary per cluster.
+    # No max_features cap: it would be shared by every cluster, and only the top 3 per row are read.
+    vectorizer = TfidfVectorizer(stop_words='english')
+    cluster_ids, texts = zip(*cluster_texts.items())
+    scores = vectorizer.fit_transform(texts).toarray()
+    vocab = vectorizer.get_feature_names_out()
+    top = np.argsort(-scores, axis=1, kind="stable")[:, :3]  # Top 3 keywords
+
     topic_keywords = {}
-    for cluster_id, text in cluster_texts.items():
-        tfidf_matrix = vectorizer.fit_transform([text])
-        scores = zip(vectorizer.get_feature_names_out(), tfidf_matrix.toarray()[0])
-        sorted_words = sorted(scores, key=lambda x: x[1], reverse=True)
-        keywords = [word for word, score in sorted_words[:3]]  # Top 3 keywords
+    for row, cluster_id in enumerate(cluster_ids):
+        keywords = [vocab[j] for j in top[row] if scores[row, j] > 0]
         topic_keywords[cluster_id] = " / ".join(keywords).title()
     return topic_keywords
 
 
 def call_gpt_topic_detector(text, page, line):
-    new_embedding = model.encode([text])[0]
-
-    if embedding_cache is None or len(embedding_cache) == 0:
+    if embedding_cache.shape[0] == 0:
         return "Unknown", page, line
 
-    def cosine_sim(a, b):
-        a_norm = np.linalg.norm(a)
-        b_norm = np.linalg.norm(b)
-        if a_norm == 0 or b_norm == 0:
-            return 0
-        return np.dot(a, b) / (a_norm * b_norm)
+    query = model.encode(text, show_progress_bar=False, normalize_embeddings=True).astype(np.float32, copy=False)
 
-    similarities = [cosine_sim(e, new_embedding) for e in embedding_cache]
-    best_match_index = np.argmax(similarities)
+    # Cached rows are unit length, so the dot product is the cosine similarity
+    best_match_index = int(_best_matches(query[np.newaxis])[0])
     best_chunk = chunk_cache[best_match_index]
 
     topic = best_chunk.get("topic_name", "Unknown")
 
     return topic, page, line
+
+
+def call_gpt_topic_detector_batch(texts, pages, lines):
+    """Tag many lines at once: one batched encode and one (M x D)·(D x N) matmul instead of M lookups"""
+    if embedding_cache.shape[0] == 0:
+        return [("Unknown", page, line) for page, line in zip(pages, lines)]
+
+    queries = model.encode(
+        list(texts),
+        batch_size=64,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=True
+    ).astype(np.float32, copy=False)
+
+    best_match_indices = _best_matches(queries)
+    topics = [chunk_cache[i].get("topic_name", "Unknown") for i in best_match_indices]
+
+    return list(zip(topics, pages, lines))
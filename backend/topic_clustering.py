@@ -48,13 +48,14 @@ class GeminiTopicClusterer:
             }
         )
         self.rate_limit_delay = 1.5  # seconds between calls
+        self.rate_limit_last_call = 0.0  # time.monotonic() of the last call
 
     def _enforce_rate_limit(self):
         """Ensure we don't exceed API rate limits"""
-        elapsed = time.time() - self.rate_limit_last_call
+        elapsed = time.monotonic() - self.rate_limit_last_call
         if elapsed < self.rate_limit_delay:
             time.sleep(self.rate_limit_delay - elapsed)
-        self.rate_limit_last_call = time.time()
+        self.rate_limit_last_call = time.monotonic()
 
     def cluster_topics(self, topics: List[Dict], max_clusters: int = 5) -> List[TopicCluster]:
         """
@@ -63,11 +64,7 @@ class GeminiTopicClusterer:
         if not topics:
             return []
 
-        # Prepare the input for Gemini
-        topics_str = "\n".join(
-            f"- {t['title']} (Page {t.get('page', '?')}, Line {t.get('line', '?')}): {t.get('context', '')[:100]}..."
-            for t in topics
-        )
+        topics_str = self._format_topics(topics)
 
         prompt = f"""
         As a legal AI expert, analyze these deposition topics and group them into {max_clusters} 
@@ -104,51 +101,124 @@ class GeminiTopicClusterer:
         }}
         """
 
-        try:
-            self._enforce_rate_limit()
-            response = self.model.generate_content(prompt)
-            
-            # Parse the response
-            if response.candidates and response.candidates[0].content.parts:
-                result = json.loads(response.text)
-                return [
-                    TopicCluster(
-                        name=c["name"],
-                        topics=c["topics"],
-                        legal_theme=c["legal_theme"],
-                        key_issues=c["key_issues"],
-                        confidence=c.get("confidence", 0.7),
-                        representative_excerpt=c["representative_excerpt"]
-                    )
-                    for c in result.get("clusters", [])
-                ]
-        except Exception as e:
-            logger.error(f"Clustering failed: {str(e)}")
-        
-        return []
+        result = self._request_clusters(prompt)
+        return [self._make_cluster(c) for c in result.get("clusters", [])]
 
     def hierarchical_cluster(self, topics: List[Dict], levels: int = 2) -> Dict:
         """
-        Create a hierarchical cluster structure using recursive Gemini analysis
+        Create a hierarchical cluster structure from a single nested Gemini analysis
         """
         if not topics or levels <= 0:
             return {}
 
-        top_level = self.cluster_topics(topics, max_clusters=3)
-        
+        topics_str = self._format_topics(topics)
+
+        prompt = f"""
+        As a legal AI expert, organize these deposition topics into a hierarchy {levels} level(s) deep.
+        At the top level create 3 semantically meaningful clusters; split each cluster into up to 3
+        subclusters, recursively, until the hierarchy is {levels} level(s) deep. Group based on:
+
+        1. Legal issues addressed
+        2. Factual patterns
+        3. Testimony type
+        4. Relevance to case theories
+
+        For each cluster and subcluster provide:
+        - A concise name (3-5 words)
+        - List of member topics (subcluster members must come from the parent's topics)
+        - The primary legal theme
+        - 3-5 key issues covered
+        - Confidence score (0-1)
+        - A representative excerpt
+        - Its subclusters in the same format (an empty list at the deepest level)
+
+        Topics:
+        {topics_str}
+
+        Return JSON format:
+        {{
+            "clusters": [
+                {{
+                    "name": "string",
+                    "topics": ["list"],
+                    "legal_theme": "string",
+                    "key_issues": ["list"],
+                    "confidence": float,
+                    "representative_excerpt": "string",
+                    "subclusters": [ /* same cluster format, nested */ ]
+                }}
+            ]
+        }}
+        """
+
+        result = self._request_clusters(prompt)
+        return self._build_hierarchy(result.get("clusters", []), topics, levels)
+
+    def _build_hierarchy(self, clusters: List[Dict], topics: List[Dict], levels: int) -> Dict:
+        """Turn nested cluster JSON into the hierarchy dict without further API calls"""
         hierarchy = {}
-        for cluster in top_level:
-            self._enforce_rate_limit()
-            hierarchy[cluster.name] = {
-                "details": cluster,
-                "subclusters": self.hierarchical_cluster(
+        for c in clusters:
+            cluster = self._make_cluster(c)
+            if "subclusters" in c:
+                members = [t for t in topics if t['title'] in cluster.topics]
+                subclusters = self._build_hierarchy(c["subclusters"], members, levels - 1) if levels > 1 else {}
+            else:
+                # Flat response - fall back to clustering this branch with its own request
+                subclusters = self.hierarchical_cluster(
                     [t for t in topics if t['title'] in cluster.topics],
                     levels - 1
                 )
+            hierarchy[cluster.name] = {
+                "details": cluster,
+                "subclusters": subclusters
             }
-        
+
         return hierarchy
 
+    @staticmethod
+    def _format_topics(topics: List[Dict]) -> str:
+        """Prepare the topic listing for a Gemini prompt"""
+        return "\n".join(
+            f"- {t['title']} (Page {t.get('page', '?')}, Line {t.get('line', '?')}): {t.get('context', '')[:100]}..."
+            for t in topics
+        )
+
+    @staticmethod
+    def _make_cluster(c: Dict) -> TopicCluster:
+        """Build a TopicCluster from one cluster object in the response"""
+        return TopicCluster(
+            name=c["name"],
+            topics=c["topics"],
+            legal_theme=c["legal_theme"],
+            key_issues=c["key_issues"],
+            confidence=c.get("confidence", 0.7),
+            representative_excerpt=c["representative_excerpt"]
+        )
+
+    def _request_clusters(self, prompt: str) -> Dict:
+        """Send a clustering prompt and parse the JSON response ({} on failure)"""
+        try:
+            self._enforce_rate_limit()
+            response = self.model.generate_content(prompt)
+            
+            # Parse the response
+            if response.candidates and response.candidates[0].content.parts:
+                result = json.loads(response.text)
+                # Validate cluster fields here so a malformed response is logged like any other failure
+                self._validate_clusters(result.get("clusters", []))
+                return result
+        except Exception as e:
+            logger.error(f"Clustering failed: {str(e)}")
+        
+        return {}
+
+    @classmethod
+    def _validate_clusters(cls, clusters: List[Dict]) -> None:
+        """Raise if any cluster, at any depth, can't be turned into a TopicCluster"""
+        for c in clusters:
+            cls._make_cluster(c)
+            cls._validate_clusters(c.get("subclusters", []))
+
 def save_clusters(clusters: List[TopicCluster], output_path: str) -> None:
     """Save clusters with proper formatting"""
     try:
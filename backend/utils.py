@@ -1,63 +1,156 @@
 import re
 import os
+from dataclasses import dataclass
+from itertools import islice
+from typing import List, TYPE_CHECKING
+import orjson
+
+# numpy is only needed for the columnar parse - keep it out of every importer's startup
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def json_loads(data):
+    """
+    Decodes JSON from str or bytes using orjson.
+    Raises orjson.JSONDecodeError, a subclass of json.JSONDecodeError.
+    """
+    return orjson.loads(data)
+
+
+def json_dumpb(obj, indent=False):
+    """
+    Encodes obj to UTF-8 JSON bytes using orjson, optionally indented by two spaces.
+    Dataclasses (e.g. TopicModel) are serialized natively, without asdict().
+    """
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+
+def json_dumps(obj, indent=False):
+    """
+    Encodes obj to a JSON string using orjson, optionally indented by two spaces.
+    """
+    return json_dumpb(obj, indent).decode("utf-8")
+
+
+_PAGE_RE = re.compile(r'^Page\s+(\d+)', re.IGNORECASE)
+_LINE_RE = re.compile(r'^Line\s+(\d+):\s+(.*)', re.IGNORECASE)
+
 
 def parse_transcript(file_path):
     """
-    Parses the transcript file and returns a list of dictionaries with page, line, and text info.
+    Parses the transcript file and yields dictionaries with page, line, and text info.
     Expected format:
       Page 1
       Line 1: This is the text.
       Line 2: More text.
       Page 2
       ...
+    The file is read line by line; wrap the result in list() where indexing is needed.
+    A missing file raises FileNotFoundError immediately, an empty one ValueError once exhausted.
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Transcript file not found at: {file_path}")
 
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
+    return (
+        {"page": page, "line": line_num, "text": text}
+        for page, line_num, text in _iter_transcript(file_path)
+    )
+
+
+@dataclass(slots=True)
+class TranscriptColumns:
+    """
+    Column-wise parsed transcript: parallel page and line arrays plus the list of texts.
+    """
+    pages: "np.ndarray"
+    lines: "np.ndarray"
+    texts: List[str]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def as_records(self):
+        """
+        Row-wise view with the same dictionaries parse_transcript yields.
+        """
+        return [
+            {"page": page, "line": line_num, "text": text}
+            for page, line_num, text in zip(self.pages.tolist(), self.lines.tolist(), self.texts)
+        ]
+
+
+def parse_transcript_columns(file_path):
+    """
+    Parses the transcript file like parse_transcript, but returns a TranscriptColumns
+    so consumers can work on whole columns instead of one dictionary per line.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Transcript file not found at: {file_path}")
 
-    parsed_lines = []
+    import numpy as np
+    pages, lines, texts = zip(*_iter_transcript(file_path))
+    return TranscriptColumns(
+        pages=np.array(pages, dtype=np.int32),
+        lines=np.array(lines, dtype=np.int32),
+        texts=list(texts)
+    )
+
+
+def _iter_transcript(file_path):
+    """
+    Yields (page, line, text) tuples; raises ValueError if the file holds no valid lines.
+    """
     current_page = None
+    found = False
 
-    for raw_line in lines:
-        line = raw_line.strip()
-
-        # Detect page number
-        page_match = re.match(r'^Page\s+(\d+)', line, re.IGNORECASE)
-        if page_match:
-            current_page = int(page_match.group(1))
-            continue
-
-        # Detect line with transcript text
-        line_match = re.match(r'^Line\s+(\d+):\s+(.*)', line, re.IGNORECASE)
-        if line_match and current_page is not None:
-            line_num = int(line_match.group(1))
-            text = line_match.group(2).strip()
-            if text:
-                parsed_lines.append({
-                    "page": current_page,
-                    "line": line_num,
-                    "text": text
-                })
-
-    if not parsed_lines:
-        raise ValueError("Transcript file is empty or contains no valid lines.")
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for raw_line in file:
+            line = raw_line.strip()
+
+            # Detect page number
+            page_match = _PAGE_RE.match(line)
+            if page_match:
+                current_page = int(page_match.group(1))
+                continue
 
-    return parsed_lines
+            # Detect line with transcript text
+            line_match = _LINE_RE.match(line)
+            if line_match and current_page is not None:
+                line_num = int(line_match.group(1))
+                text = line_match.group(2).strip()
+                if text:
+                    found = True
+                    yield current_page, line_num, text
+
+    if not found:
+        raise ValueError("Transcript file is empty or contains no valid lines.")
 
 
 def chunk_transcript(parsed_lines, chunk_size=50):
     """
     Chunks parsed transcript lines into groups of `chunk_size` lines.
     Each chunk retains the page and line number of its first line.
+    Accepts any iterable, including the generator returned by parse_transcript,
+    or a TranscriptColumns from parse_transcript_columns.
     """
-    if not parsed_lines:
-        return []
+    if isinstance(parsed_lines, TranscriptColumns):
+        texts = parsed_lines.texts
+        return [
+            {"text": " ".join(texts[start:start + chunk_size]), "page": page, "line": line_num}
+            for start, page, line_num in zip(
+                range(0, len(texts), chunk_size),
+                parsed_lines.pages[::chunk_size].tolist(),
+                parsed_lines.lines[::chunk_size].tolist()
+            )
+        ]
 
     chunks = []
-    for i in range(0, len(parsed_lines), chunk_size):
-        chunk_lines = parsed_lines[i:i + chunk_size]
+    parsed_lines = iter(parsed_lines)
+    while True:
+        chunk_lines = list(islice(parsed_lines, chunk_size))
+        if not chunk_lines:
+            break
         text = " ".join([line["text"] for line in chunk_lines])
         first_line = chunk_lines[0]
 